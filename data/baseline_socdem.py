@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List
 import os
-import json
+from utils.mappings import save_item_id_map
 
 def load_data() -> tuple:
     """
@@ -166,8 +166,7 @@ def create_video_info_table(video_df: pd.DataFrame) -> pd.DataFrame:
     os.makedirs(mappings_dir, exist_ok=True)
     
     # Сохраняем маппинг видео
-    with open(os.path.join(mappings_dir, 'item_id_map.json'), 'w', encoding='utf-8') as f:
-        json.dump(item_id_map, f, ensure_ascii=False, indent=2)
+    save_item_id_map(item_id_map, os.path.join(mappings_dir, 'item_id_map.parquet'))
     print(f"Saved item_id_map with {len(item_id_map)} items")
     
     # Сохраняем маппинг категорий
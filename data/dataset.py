@@ -132,12 +132,22 @@ class BuildTrainDataset(Dataset):
             torch.tensor(0, dtype=torch.int64),
         )
 
-def get_dataloader(dataset, batch_size, shuffle=True):
+def get_dataloader(dataset, batch_size, shuffle=True, num_workers=0, prefetch_factor=4):
+    # pinned memory позволяет копировать батчи на GPU асинхронно (non_blocking)
+    worker_kwargs = {}
+    if num_workers > 0:
+        worker_kwargs = {
+            'persistent_workers': True,
+            'prefetch_factor': prefetch_factor
+        }
     return DataLoader(
         dataset,
         batch_size=batch_size,
         shuffle=shuffle,
-        collate_fn=custom_collate_fn
+        collate_fn=custom_collate_fn,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        **worker_kwargs
     )
 
 def custom_collate_fn(batch):
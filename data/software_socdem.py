@@ -2,30 +2,151 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List
 import os
-import json
 import hashlib
+import orjson
+import xxhash
+from itertools import islice
+from numba import njit
 
-def create_hash(text: str) -> str:
+from utils.mappings import save_item_id_map
+
+# Алгоритм хеширования ID: 'xxh3' (быстрый, по умолчанию) или 'sha256'
+# (для совместимости с ранее сохраненными маппингами)
+HASH_ALGORITHM = 'xxh3'
+
+# Начиная с этого числа строк (репозиторий, язык) топ языков считается через numba
+NUMBA_MIN_ROWS = 1_000_000
+
+# Путь к метаданным репозиториев: JSON-массив (.json) или JSON Lines (.jsonl)
+REPO_METADATA_PATH = '/home/romanova.karina2/.cache/kagglehub/datasets/pelmers/github-repository-metadata-with-5-stars/versions/15/repo_metadata.json'
+
+# Сколько строк JSONL разбирается за раз (ограничивает число одновременно живых dict)
+JSONL_CHUNK_ROWS = 100_000
+
+def create_hash(text: str, algorithm: str = None) -> str:
+    """
+    Создает 16-символьный хеш из строки (xxh3_64 или SHA-256)
     """
-    Создает SHA-256 хеш из строки
+    algorithm = algorithm or HASH_ALGORITHM
+    if algorithm == 'sha256':
+        return hashlib.sha256(text.encode()).hexdigest()[:16]  # Берем первые 16 символов для удобства
+    if algorithm == 'xxh3':
+        return xxhash.xxh3_64_hexdigest(text.encode())  # Уже 16 символов
+    raise ValueError(f"Неизвестный алгоритм хеширования: {algorithm}")
+
+def _hash_series(s: pd.Series, algorithm: str = None) -> pd.Series:
+    """
+    Хеширует колонку строк: считаем хеш только для уникальных значений и маппим обратно
     """
-    return hashlib.sha256(text.encode()).hexdigest()[:16]  # Берем первые 16 символов для удобства
+    # Владельцы сильно повторяются, поэтому уникальных значений на порядки меньше, чем строк
+    mapping = {u: create_hash(u, algorithm) for u in s.dropna().unique()}
+    return s.map(mapping)
 
-def load_data() -> pd.DataFrame:
+@njit(cache=True)
+def _top_k_per_group(group_ids, item_ids, values, n_items, k):
     """
-    Загружает данные о репозиториях из repo_metadata.json
+    Суммирует values по парам (группа, элемент) и возвращает top-k элементов каждой группы.
+    При равных суммах раньше идет пара, которая раньше встретилась во входных данных
+    (так же, как в pandas-ветке _top_languages)
+    """
+    n = group_ids.shape[0]
+    keys = group_ids.astype(np.int64) * n_items + item_ids.astype(np.int64)
+    order = np.argsort(keys, kind='mergesort')
+    
+    # Суммируем значения по подряд идущим одинаковым ключам
+    run_keys = np.empty(n, np.int64)
+    run_sums = np.empty(n, np.int64)
+    run_first = np.empty(n, np.int64)
+    m = 0
+    for i in range(n):
+        key = keys[order[i]]
+        if m > 0 and run_keys[m - 1] == key:
+            run_sums[m - 1] += values[order[i]]
+        else:
+            run_keys[m] = key
+            run_sums[m] = values[order[i]]
+            # Сортировка устойчивая, поэтому первая строка отрезка - первое появление пары
+            run_first[m] = order[i]
+            m += 1
+    
+    out_groups = np.empty(m, np.int64)
+    out_items = np.empty(m, np.int64)
+    out_values = np.empty(m, np.int64)
+    c = 0
+    start = 0
+    while start < m:
+        group = run_keys[start] // n_items
+        end = start
+        while end < m and run_keys[end] // n_items == group:
+            end += 1
+        
+        # k маленькое, поэтому k проходов по группе дешевле сортировки
+        taken = np.zeros(end - start, np.bool_)
+        for _ in range(min(k, end - start)):
+            best = -1
+            for j in range(start, end):
+                if taken[j - start]:
+                    continue
+                if (best == -1 or run_sums[j] > run_sums[best]
+                        or (run_sums[j] == run_sums[best] and run_first[j] < run_first[best])):
+                    best = j
+            taken[best - start] = True
+            out_groups[c] = group
+            out_items[c] = run_keys[best] % n_items
+            out_values[c] = run_sums[best]
+            c += 1
+        start = end
+    
+    return out_groups[:c], out_items[:c], out_values[:c]
+
+def _top_languages(owner_codes: np.ndarray, lang_ids: np.ndarray, sizes: np.ndarray,
+                   n_langs: int, k: int = 3, use_numba: bool = None) -> pd.DataFrame:
+    """
+    Возвращает top-k языков по суммарному размеру для каждого владельца (owner_code, lang_id, size).
+    При равных размерах порядок - как у первого появления языка у владельца
+    """
+    if use_numba is None:
+        use_numba = len(owner_codes) >= NUMBA_MIN_ROWS
+    if not use_numba:
+        lang_df = pd.DataFrame({'owner_code': owner_codes, 'lang_id': lang_ids, 'size': sizes})
+        lang_totals = lang_df.groupby(['owner_code', 'lang_id'], sort=False)['size'].sum()
+        return (lang_totals.sort_values(ascending=False, kind='stable')
+                .groupby(level='owner_code', sort=False)
+                .head(k)
+                .reset_index())
+    
+    groups, items, totals = _top_k_per_group(owner_codes, lang_ids, sizes.astype(np.int64), n_langs, k)
+    return pd.DataFrame({'owner_code': groups, 'lang_id': items, 'size': totals})
+
+def load_data(json_path: str = REPO_METADATA_PATH) -> pd.DataFrame:
+    """
+    Загружает данные о репозиториях из JSON-массива (.json) или JSON Lines (.jsonl)
     """
     # Проверяем существование файла
-    json_path = '/home/romanova.karina2/.cache/kagglehub/datasets/pelmers/github-repository-metadata-with-5-stars/versions/15/repo_metadata.json'
     if not os.path.exists(json_path):
         raise FileNotFoundError(f"Файл {json_path} не найден")
     
-    # Загружаем данные из JSON
-    with open(json_path, 'r', encoding='utf-8') as f:
-        repos_data = json.load(f)
-    
-    # Преобразуем в DataFrame
-    data = pd.DataFrame(repos_data)
+    # Загружаем данные из JSON (orjson парсит в разы быстрее stdlib json)
+    with open(json_path, 'rb') as f:
+        if json_path.endswith('.jsonl'):
+            # JSONL разбираем частями: в памяти только готовые части DataFrame
+            # и не больше JSONL_CHUNK_ROWS записей в виде dict
+            chunks = []
+            while True:
+                lines = list(islice(f, JSONL_CHUNK_ROWS))
+                if not lines:
+                    break
+                chunks.append(pd.DataFrame.from_records([orjson.loads(line) for line in lines if line.strip()]))
+            data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            del chunks
+        else:
+            # JSON-массив нельзя разобрать по частям: освобождаем сырые байты
+            # и список записей сразу, как только они больше не нужны
+            raw = f.read()
+            records = orjson.loads(raw)
+            del raw
+            data = pd.DataFrame(records)
+            del records
     
     # Обрабатываем вложенные структуры
     if 'languages' in data.columns:
@@ -34,11 +155,6 @@ def load_data() -> pd.DataFrame:
     if 'topics' in data.columns:
         data['topics'] = data['topics'].apply(lambda x: [{"name": t, "stars": 0} for t in x] if isinstance(x, list) else x)
     
-    # Заполняем пропуски
-    for col in ['description', 'primaryLanguage', 'license', 'codeOfConduct']:
-        if col in data.columns:
-            data[col] = data[col].replace({np.nan: None})
-    
     # Преобразуем даты
     for col in ['createdAt', 'pushedAt']:
         if col in data.columns:
@@ -58,17 +174,35 @@ def load_data() -> pd.DataFrame:
         if col in data.columns:
             data[col] = data[col].fillna(False).astype(bool)
     
+    # Строковые колонки храним в Arrow: пропуски становятся нативными null,
+    # а строковые операции выполняются без Python-объектов
+    string_cols = ['nameWithOwner', 'owner', 'description', 'primaryLanguage', 'license', 'codeOfConduct']
+    for col in string_cols:
+        if col in data.columns:
+            data[col] = data[col].astype('string[pyarrow]')
+    
     print(f"Загружено {len(data)} репозиториев")
     return data
 
+def create_language_table(df: pd.DataFrame) -> tuple:
+    """
+    Разворачивает колонку languages в длинную таблицу (repo_idx, lang_id, size)
+    и возвращает ее вместе со списком названий языков (lang_id - позиция в нем)
+    """
+    # Позиционный индекс, чтобы repo_idx указывал на строку df
+    exploded = pd.Series(df['languages'].to_numpy()).explode().dropna()
+    lang_ids, language_names = pd.factorize(pd.Series([lang['name'] for lang in exploded], dtype=object))
+    lang_long = pd.DataFrame({
+        'repo_idx': exploded.index.to_numpy(np.int64),
+        'lang_id': lang_ids.astype(np.int32),
+        'size': np.array([lang['size'] for lang in exploded], dtype=np.int64),
+    })
+    return lang_long, language_names
+
 def create_repo_history_sorted(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Создает историю взаимодействия с репозиториями
+    Создает историю взаимодействия с репозиториями (ожидает колонки repo_id и owner_hash)
     """
-    # Создаем хеши для репозиториев и владельцев
-    df['repo_id'] = df['nameWithOwner'].apply(create_hash)
-    df['owner_hash'] = df['owner'].apply(create_hash)
-    
     # Сортируем по дате последнего обновления
     df = df.sort_values('pushedAt')
     
@@ -82,48 +216,49 @@ def create_repo_history_sorted(df: pd.DataFrame) -> pd.DataFrame:
 
 def create_detailed_repo_history(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Создает детальное текстовое описание репозиториев
+    Создает детальное текстовое описание репозиториев (ожидает колонку owner_hash)
     """
-    def create_repo_description(row):
-        parts = []
-        
-        if pd.notna(row['description']):
-            parts.append(f"Описание: {row['description']}")
-            
-        if pd.notna(row['primaryLanguage']):
-            parts.append(f"Основной язык: {row['primaryLanguage']}")
-            
-        if row['languages']:
-            lang_str = ', '.join([f"{lang['name']} ({lang['size']} байт)" for lang in row['languages']])
-            parts.append(f"Используемые языки: {lang_str}")
-            
-        if row['topics']:
-            # Обрабатываем вложенную структуру тем
-            topics_list = []
-            for topic in row['topics']:
-                if isinstance(topic, dict) and 'name' in topic:
-                    if isinstance(topic['name'], dict) and 'name' in topic['name']:
-                        topics_list.append(topic['name']['name'])
-                    else:
-                        topics_list.append(str(topic['name']))
-            if topics_list:
-                topics_str = ', '.join(topics_list)
-                parts.append(f"Темы: {topics_str}")
-            
-        if pd.notna(row['createdAt']):
-            parts.append(f"Создан: {row['createdAt']}")
-            
-        if pd.notna(row['pushedAt']):
-            parts.append(f"Последнее обновление: {row['pushedAt']}")
-            
-        return ' ; '.join(parts)
-    
-    # Создаем хеши для репозиториев и владельцев
-    df['repo_id'] = df['nameWithOwner'].apply(create_hash)
-    df['owner_hash'] = df['owner'].apply(create_hash)
+    def prefixed(values: pd.Series, prefix: str) -> pd.Series:
+        # Часть описания вместе с разделителем; для пропусков - пустая строка
+        text = prefix + values.astype('string[pyarrow]') + ' ; '
+        return text.where(values.notna(), '')
+
+    def languages_str(langs) -> str:
+        if not isinstance(langs, list) or not langs:
+            return None
+        return ', '.join([f"{lang['name']} ({lang['size']} байт)" for lang in langs])
+
+    def topics_str(topics) -> str:
+        if not isinstance(topics, list) or not topics:
+            return None
+        # Обрабатываем вложенную структуру тем
+        topics_list = []
+        for topic in topics:
+            if isinstance(topic, dict) and 'name' in topic:
+                if isinstance(topic['name'], dict) and 'name' in topic['name']:
+                    topics_list.append(topic['name']['name'])
+                else:
+                    topics_list.append(str(topic['name']))
+        return ', '.join(topics_list) if topics_list else None
+
+    # Вложенные списки сворачиваем в строки одним проходом, остальное - векторно
+    languages = pd.Series([languages_str(x) for x in df['languages']], index=df.index, dtype=object)
+    topics = pd.Series([topics_str(x) for x in df['topics']], index=df.index, dtype=object)
+    # Даты форматируем через str(Timestamp), как f-строка: astype('string') отбрасывает
+    # нулевое время ('2020-01-20' вместо '2020-01-20 00:00:00')
+    created_at = df['createdAt'].map(str, na_action='ignore')
+    pushed_at = df['pushedAt'].map(str, na_action='ignore')
     
     # Создаем детальное описание для каждого репозитория
-    df['detailed_view'] = df.apply(create_repo_description, axis=1)
+    detailed_view = (
+        prefixed(df['description'], "Описание: ")
+        + prefixed(df['primaryLanguage'], "Основной язык: ")
+        + prefixed(languages, "Используемые языки: ")
+        + prefixed(topics, "Темы: ")
+        + prefixed(created_at, "Создан: ")
+        + prefixed(pushed_at, "Последнее обновление: ")
+    )
+    df['detailed_view'] = detailed_view.str.removesuffix(' ; ')
     
     # Группируем по хешу владельца
     user_history = df.groupby('owner_hash').agg({
@@ -133,68 +268,63 @@ def create_detailed_repo_history(df: pd.DataFrame) -> pd.DataFrame:
     
     return user_history
 
-def create_user_description(df: pd.DataFrame) -> pd.DataFrame:
+def create_user_description(df: pd.DataFrame, lang_long: pd.DataFrame, language_names: pd.Index) -> pd.DataFrame:
     """
-    Создает текстовое описание пользователей на основе их активности
+    Создает текстовое описание пользователей на основе их активности (ожидает колонку owner_hash)
     """
-    def create_description(group):
-        row = group.iloc[0]
-        
-        # Собираем статистику по репозиториям пользователя
-        total_stars = group['stars'].sum()
-        total_forks = group['forks'].sum()
-        total_watchers = group['watchers'].sum()
-        total_commits = group['defaultBranchCommitCount'].sum()
-        
-        # Собираем информацию о языках
-        languages = {}
-        for langs in group['languages']:
-            for lang in langs:
-                name = lang['name']
-                size = lang['size']
-                if name in languages:
-                    languages[name] += size
-                else:
-                    languages[name] = size
-        
-        # Сортируем языки по использованию
-        top_languages = sorted(languages.items(), key=lambda x: x[1], reverse=True)[:3]
-        top_langs_str = ', '.join([f"{lang} ({size} байт)" for lang, size in top_languages])
-        
-        description = (
-            f"passage: Владелец {len(group)} репозиториев, "
-            f"всего {total_stars} звезд, {total_forks} форков, "
-            f"{total_watchers} наблюдателей, {total_commits} коммитов. "
-            f"Основные языки: {top_langs_str}"
-        )
-        return description
-    
-    # Создаем хеши для владельцев
-    df['owner_hash'] = df['owner'].apply(create_hash)
-    
-    user_descriptions = (df.groupby('owner_hash')
-                        .apply(create_description)
-                        .reset_index()
-                        .rename(columns={0: 'user_description'}))
+    # Собираем статистику по репозиториям пользователя
+    stats = df.groupby('owner_hash').agg(
+        repo_count=('owner_hash', 'size'),
+        total_stars=('stars', 'sum'),
+        total_forks=('forks', 'sum'),
+        total_watchers=('watchers', 'sum'),
+        total_commits=('defaultBranchCommitCount', 'sum'),
+    )
+    
+    # Собираем информацию о языках: владелец для каждой строки (репозиторий, язык)
+    owner_codes, owners = pd.factorize(df['owner_hash'])
+    lang_owner_codes = owner_codes[lang_long['repo_idx'].to_numpy()]
+    has_owner = lang_owner_codes >= 0
+    
+    # Сортируем языки по использованию и берем топ-3 для каждого владельца
+    top_languages = _top_languages(
+        lang_owner_codes[has_owner],
+        lang_long['lang_id'].to_numpy()[has_owner],
+        lang_long['size'].to_numpy()[has_owner],
+        len(language_names),
+        k=3,
+    )
+    # Названия материализуем только для отобранных языков
+    top_languages['owner_hash'] = np.asarray(owners)[top_languages['owner_code'].to_numpy()]
+    top_names = pd.Series(np.asarray(language_names)[top_languages['lang_id'].to_numpy()], index=top_languages.index)
+    top_languages['text'] = top_names + ' (' + top_languages['size'].astype(str) + ' байт)'
+    top_langs_str = top_languages.groupby('owner_hash', sort=False)['text'].agg(', '.join)
+    top_langs_str = top_langs_str.reindex(stats.index).fillna('')
+    
+    description = (
+        "passage: Владелец " + stats['repo_count'].astype(str) + " репозиториев, "
+        + "всего " + stats['total_stars'].astype(str) + " звезд, "
+        + stats['total_forks'].astype(str) + " форков, "
+        + stats['total_watchers'].astype(str) + " наблюдателей, "
+        + stats['total_commits'].astype(str) + " коммитов. "
+        + "Основные языки: " + top_langs_str
+    )
+    
+    user_descriptions = description.rename('user_description').reset_index()
     
     return user_descriptions
 
-def create_repo_info_table(df: pd.DataFrame) -> pd.DataFrame:
+def create_repo_info_table(df: pd.DataFrame, language_names: pd.Index) -> pd.DataFrame:
     """
-    Создает таблицу с информацией о репозиториях для инференса
+    Создает таблицу с информацией о репозиториях для инференса (ожидает колонку repo_id)
     """
-    # Создаем уникальный маппинг языков в числа
-    all_languages = set()
-    for langs in df['languages']:
-        for lang in langs:
-            all_languages.add(lang['name'])
-    language_to_id = {lang: idx for idx, lang in enumerate(all_languages)}
+    # Маппинг языков в числа совпадает с lang_id из таблицы языков
+    language_to_id = {lang: idx for idx, lang in enumerate(language_names)}
     
     # Подготавливаем таблицу
-    repo_info = df[['nameWithOwner', 'description', 'primaryLanguage', 'languages', 'topics']].copy()
+    repo_info = df[['repo_id', 'nameWithOwner', 'description', 'primaryLanguage', 'languages', 'topics']].copy()
     
     # Создаем маппинг ID репозиториев в числовые индексы
-    df['repo_id'] = df['nameWithOwner'].apply(create_hash)
     item_id_map = {repo_id: idx for idx, repo_id in enumerate(repo_info['repo_id'].unique())}
     
     # Добавляем числовой ID языка
@@ -210,8 +340,7 @@ def create_repo_info_table(df: pd.DataFrame) -> pd.DataFrame:
     os.makedirs(mappings_dir, exist_ok=True)
     
     # Сохраняем маппинг репозиториев
-    with open(os.path.join(mappings_dir, 'item_id_map.json'), 'w', encoding='utf-8') as f:
-        json.dump(item_id_map, f, ensure_ascii=False, indent=2)
+    save_item_id_map(item_id_map, os.path.join(mappings_dir, 'item_id_map.parquet'))
     print(f"Saved item_id_map with {len(item_id_map)} items")
     
     # Сохраняем маппинг языков
@@ -227,10 +356,17 @@ def main():
     # Загружаем данные
     data = load_data()
     
+    # Хеши репозиториев и владельцев считаем один раз для всех таблиц
+    data['repo_id'] = _hash_series(data['nameWithOwner'])
+    data['owner_hash'] = _hash_series(data['owner'])
+    
+    # Языки в длинном формате (repo_idx, lang_id, size) для векторных агрегаций
+    lang_long, language_names = create_language_table(data)
+    
     # Создаем историю репозиториев
     user_history_df = create_repo_history_sorted(data)
     detailed_history_df = create_detailed_repo_history(data)
-    user_descriptions = create_user_description(data)
+    user_descriptions = create_user_description(data, lang_long, language_names)
 
     # Сохраняем результаты
     detailed_history_df.to_parquet('./data/textual_history.parquet')
@@ -238,7 +374,7 @@ def main():
     user_descriptions.to_parquet('./data/user_descriptions.parquet')
 
     # Создаем таблицу для инференса
-    repo_info = create_repo_info_table(data)
+    repo_info = create_repo_info_table(data, language_names)
     repo_info.to_parquet('./data/repo_info.parquet')
 
 if __name__ == "__main__":
@@ -5,7 +5,7 @@ import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import yaml
-import json
+from utils.mappings import load_item_id_map
 
 from transformers import AutoTokenizer, AutoModel
 from torch.utils.data import Dataset, DataLoader
@@ -89,8 +89,7 @@ def main(config=None):
     tokenizer = AutoTokenizer.from_pretrained("intfloat/multilingual-e5-base")
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
-    with open('./data/mappings/item_id_map.json', 'r', encoding='utf-8') as f:
-        item_id_map = json.load(f)
+    item_id_map = load_item_id_map()
     print(f"Loaded item_id_map with {len(item_id_map)} items")
 
     # 4) Создаем датасет для индексации
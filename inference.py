@@ -8,7 +8,7 @@ import os
 import yaml
 import pandas as pd
 import faiss
-import json
+from utils.mappings import load_item_id_map
 import numpy as np
 
 from models.multimodal_model import MultimodalRecommendationModel
@@ -138,8 +138,7 @@ if __name__ == "__main__":
     user_descriptions = pd.read_parquet('./data/user_descriptions.parquet')
 
     # Загружаем маппинг
-    with open('./data/mappings/item_id_map.json', 'r', encoding='utf-8') as f:
-        item_id_map = json.load(f)
+    item_id_map = load_item_id_map()
     print(f"Loaded item_id_map with {len(item_id_map)} items")
     
     # Initialize tokenizer
@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.software_socdem import _top_languages, create_detailed_repo_history
+
+
+def _by_owner(top):
+    """Топ языков в виде {owner_code: [(lang_id, size), ...]} в порядке выдачи"""
+    result = {}
+    for owner, lang, size in zip(top['owner_code'], top['lang_id'], top['size']):
+        result.setdefault(int(owner), []).append((int(lang), int(size)))
+    return result
+
+
+def _assert_paths_match(owner_codes, lang_ids, sizes, n_langs, k=3):
+    pandas_top = _by_owner(_top_languages(owner_codes, lang_ids, sizes, n_langs, k=k, use_numba=False))
+    numba_top = _by_owner(_top_languages(owner_codes, lang_ids, sizes, n_langs, k=k, use_numba=True))
+    assert pandas_top == numba_top
+
+
+def test_top_languages_ties_follow_first_appearance():
+    # lang_id 0 встречается глобально раньше, но у владельца 1 язык 2 появился первым
+    owner_codes = np.array([0, 0, 0, 1, 1, 1, 1, 1, 0, 2], dtype=np.int64)
+    lang_ids = np.array([0, 1, 2, 3, 2, 0, 1, 3, 1, 0], dtype=np.int32)
+    sizes = np.array([600, 200, 200, 300, 200, 200, 500, 300, 100, 5], dtype=np.int64)
+
+    _assert_paths_match(owner_codes, lang_ids, sizes, n_langs=4)
+    top = _by_owner(_top_languages(owner_codes, lang_ids, sizes, 4, k=3, use_numba=True))
+    assert top[1] == [(3, 600), (1, 500), (2, 200)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_top_languages_paths_match_random(seed):
+    rng = np.random.default_rng(seed)
+    n_rows, n_owners, n_langs = 500, 30, 8
+    owner_codes = rng.integers(0, n_owners, n_rows).astype(np.int64)
+    lang_ids = rng.integers(0, n_langs, n_rows).astype(np.int32)
+    # Маленький диапазон размеров дает много равных сумм
+    sizes = rng.integers(1, 4, n_rows).astype(np.int64)
+
+    _assert_paths_match(owner_codes, lang_ids, sizes, n_langs)
+
+
+def test_detailed_repo_history_formats_dates_like_str():
+    # Наивные даты в полночь: str(Timestamp) сохраняет время, astype('string') - нет
+    df = pd.DataFrame({
+        'owner_hash': ['a', 'a'],
+        'description': ['repo', None],
+        'primaryLanguage': ['Python', None],
+        'languages': [[{'name': 'Python', 'size': 10}], None],
+        'topics': [None, None],
+        'createdAt': pd.to_datetime(['2020-01-20', '2021-03-01']),
+        'pushedAt': pd.to_datetime(['2020-02-01', None]),
+    })
+    history = create_detailed_repo_history(df)
+
+    expected = (
+        'query: Описание: repo ; Основной язык: Python ; Используемые языки: Python (10 байт) ; '
+        'Создан: 2020-01-20 00:00:00 ; Последнее обновление: 2020-02-01 00:00:00'
+        ' ; Создан: 2021-03-01 00:00:00'
+    )
+    assert history.loc[0, 'detailed_view'] == expected
@@ -1,7 +1,7 @@
 import yaml
 import torch
 import pandas as pd
-import json
+from utils.mappings import load_item_id_map
 import os
 from transformers import AutoTokenizer
 from data.dataset import BuildTrainDataset, get_dataloader
@@ -22,8 +22,7 @@ def train_model(config_path='configs/config.yaml'):
     tokenizer = AutoTokenizer.from_pretrained(config['model']['text_model_name'])
     
     # Загружаем маппинг
-    with open('./data/mappings/item_id_map.json', 'r', encoding='utf-8') as f:
-        item_id_map = json.load(f)
+    item_id_map = load_item_id_map()
     print(f"Loaded item_id_map with {len(item_id_map)} items")
     
     # Create training dataset with existing mapping
@@ -55,12 +54,14 @@ def train_model(config_path='configs/config.yaml'):
     # Create dataloaders
     train_loader = get_dataloader(
         train_dataset, 
-        batch_size=config['data']['batch_size']
+        batch_size=config['data']['batch_size'],
+        num_workers=config['data'].get('num_workers', 4)
     )
     val_loader = get_dataloader(
         val_dataset, 
         batch_size=config['data']['batch_size'],
-        shuffle=False
+        shuffle=False,
+        num_workers=config['data'].get('num_workers', 4)
     )
     
     # Initialize model
@@ -11,6 +11,9 @@ import numpy as np
 import faiss
 from datetime import datetime
 
+# Сколько строк эмбеддингов айтемов обрабатывается за раз при загрузке на GPU и поиске
+ITEM_CHUNK_SIZE = 262144
+
 class Trainer:
     def __init__(self, model, train_loader, val_loader, optimizer, config):
         self.model = model
@@ -32,6 +35,23 @@ class Trainer:
         print(f"Using device: {self.device}")  # Add debug print
         self.model.to(self.device)
 
+        # Скомпилированный forward (torch.compile); self.model остается исходным модулем для save_pretrained.
+        # Длина истории item_ids меняется от батча к батчу, поэтому по умолчанию dynamic=True
+        compile_config = config.get('training', {})
+        if compile_config.get('compile_model', False):
+            self.forward_model = torch.compile(
+                self.model,
+                mode=compile_config.get('compile_mode', 'default'),
+                dynamic=compile_config.get('compile_dynamic', True)
+            )
+        else:
+            self.forward_model = self.model
+
+        # Смешанная точность: bf16 на Ampere+, иначе fp16 с масштабированием градиентов
+        self.use_amp = config.get('training', {}).get('mixed_precision', True) and self.device.type == 'cuda'
+        self.amp_dtype = torch.bfloat16 if self.use_amp and torch.cuda.is_bf16_supported() else torch.float16
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.use_amp and self.amp_dtype == torch.float16)
+
         name_contrastive_loss = config.get('training', {}).get('contrastive_loss', 'cos_emb') # for future experiments with new losses
         self.recommendation_loss_fn, self.contrastive_loss_fn = get_losses(name_contrastive_loss)
 
@@ -48,6 +68,10 @@ class Trainer:
         self.patience = config.get('training', {}).get('patience', 5)
         self.no_improvement = 0
 
+        # Кэш статичных данных для валидации (индекс перестраивается перед каждой валидацией,
+        # поэтому его данные читаются заново в validate и не кэшируются)
+        self._val_data = None
+
     def train(self, epochs):
         """Полный цикл обучения с валидацией."""
         for epoch in range(epochs):
@@ -90,11 +114,12 @@ class Trainer:
     def train_epoch(self):
         """Одна эпоха обучения."""
         self.model.train()
-        total_loss = 0
-        total_contrastive_loss = 0
-        total_recommendation_loss = 0
+        # Потери копим на устройстве, чтобы не синхронизироваться с GPU на каждом шаге
+        total_loss = torch.zeros((), device=self.device)
+        total_contrastive_loss = torch.zeros((), device=self.device)
+        total_recommendation_loss = torch.zeros((), device=self.device)
 
-        for batch in tqdm(self.train_loader, desc="Training"):
+        for batch in tqdm(self._prefetch(self.train_loader), total=len(self.train_loader), desc="Training"):
             loss, c_loss, r_loss = self.training_step(batch)
             
             total_loss += loss
@@ -102,37 +127,24 @@ class Trainer:
             total_recommendation_loss += r_loss
 
         return {
-            'loss': total_loss / len(self.train_loader),
-            'contrastive_loss': total_contrastive_loss / len(self.train_loader),
-            'recommendation_loss': total_recommendation_loss / len(self.train_loader)
+            'loss': total_loss.item() / len(self.train_loader),
+            'contrastive_loss': total_contrastive_loss.item() / len(self.train_loader),
+            'recommendation_loss': total_recommendation_loss.item() / len(self.train_loader)
         }
 
     def validate(self):
         """Валидация модели с использованием актуального FAISS индекса"""
         self.model.eval()
-        total_loss = 0
-        total_contrastive_loss = 0
-        total_recommendation_loss = 0
+        total_loss = torch.zeros((), device=self.device)
+        total_contrastive_loss = torch.zeros((), device=self.device)
+        total_recommendation_loss = torch.zeros((), device=self.device)
         
-        # Загрузка необходимых данных
-        # textual_history = pd.read_parquet('./data/textual_history.parquet')
-        textual_history = pd.read_parquet('./data/textual_history.parquet')
-        df_videos = pd.read_parquet("./data/video_info.parquet")
-        df_videos = (
-            df_videos
-            .groupby('clean_video_id')['category']
-            .agg(lambda x: list(set(x)))  # убрать дубли
-            .reset_index()
-        )
-        df_videos_map = df_videos.set_index('clean_video_id').to_dict(orient='index')
+        # Данные, не зависящие от весов модели, загружаются один раз за обучение
+        val_data = self._load_val_data()
+        category_by_item_id = val_data['category_by_item_id']
+        demographics_by_uid = val_data['demographics_by_uid']
+        metrics_calculator = val_data['metrics_calculator']
 
-        try:
-            category_mapping_df = pd.read_parquet('./data/mappings/category_mapping.parquet')
-            category_mapping = dict(zip(category_mapping_df['category'], category_mapping_df['category_id']))
-            print(f"Loaded category mapping with {len(category_mapping)} categories")
-        except Exception as e:
-            print(f"Warning: Could not load category mapping: {str(e)}")
-            category_mapping = {}
         print("INDEX START")
         try:
            from indexer import main as update_index
@@ -141,92 +153,36 @@ class Trainer:
            # Сохраняем текущее состояние модели во временную директорию
            os.makedirs("temp_current_model", exist_ok=True)
            self.model.save_pretrained("temp_current_model")
-           # Обновляем индекс
+           # Обновляем индекс (файлы перезаписываются)
            update_index(config=index_config)
            print("FAISS index updated with current model weights")
         except Exception as e:
            print(f"Error updating index: {str(e)}")
            return None
         print("INDEX END")
-        # Проверка и обновление индекса
-        index_path = self.config['inference']['index_path']
-        ids_path = self.config['inference']['ids_path']
-        embeddings_path = self.config['inference']['embeddings_path']
-        
-        if not all(os.path.exists(p) for p in [index_path, ids_path, embeddings_path]):
-            print("\nIndex files not found, creating new index...")
-            try:
-                from indexer import main as create_index
-                create_index(config=self.config)
-            except Exception as e:
-                print(f"Error creating index: {str(e)}")
-                return None
 
-        # Загрузка индекса и данных
-        try:
-            index = faiss.read_index(index_path)
-            video_ids = np.load(ids_path)
-            item_embeddings_array = np.load(embeddings_path)
-        except Exception as e:
-            print(f"Error loading index or embeddings: {str(e)}")
+        # Загрузка индекса, эмбеддингов и демографических центроидов
+        index_data = self._load_index_data(val_data)
+        if index_data is None:
             return None
-        
-        # Загрузка демографических данных
-        try:
-            demographic_data = pd.read_parquet('./data/demographic_data.parquet')
-            demographic_features = ['age_group', 'sex', 'region']
-            
-            # Создаем центроиды для каждой демографической группы
-            demographic_centroids = {}
-            for feature in demographic_features:
-                demographic_centroids[feature] = {}
-                for group in demographic_data[feature].unique():
-                    # Получаем пользователей из этой группы
-                    group_users = demographic_data[demographic_data[feature] == group]['viewer_uid'].values
-                    
-                    # Получаем их эмбеддинги из истории просмотров
-                    group_embeddings = []
-                    for user_id in group_users:
-                        if user_id in textual_history['viewer_uid'].values:
-                            user_idx = textual_history[textual_history['viewer_uid'] == user_id].index[0]
-                            if user_idx < len(item_embeddings_array):
-                                group_embeddings.append(item_embeddings_array[user_idx])
-                    
-                    if group_embeddings:
-                        # Вычисляем центроид группы
-                        group_centroid = np.mean(group_embeddings, axis=0)
-                        demographic_centroids[feature][group] = torch.tensor(
-                            group_centroid, 
-                            device=self.device
-                        )
-            
-            print(f"Loaded demographic data with features: {demographic_features}")
-        except Exception as e:
-            print(f"Warning: Could not load demographic data: {str(e)}")
-            demographic_centroids = None
-            demographic_data = None
-            demographic_features = None
+        rec_video_ids = index_data['rec_video_ids']
+        rec_category_ids = index_data['rec_category_ids']
         
         # Инициализация метрик
-        sim_threshold_precision = self.config['metrics'].get('sim_threshold_precision', 0.07)
-        sim_threshold_ndcg = self.config['metrics'].get('sim_threshold_ndcg', 0.8)
-        calibration_samples = self.config['metrics'].get('calibration_samples', 1000)
-        metrics_calculator = MetricsCalculator(sim_threshold_precision=sim_threshold_precision,
-                                               sim_threshold_ndcg=sim_threshold_ndcg, calibration_samples=calibration_samples)
         metrics_accum = {metric: 0.0 for metric in ["semantic_precision@k", "cross_category_relevance", "contextual_ndcg", "precision@k", "recall@k", "ndcg@k", "mrr@k"]}
         top_k = self.config['inference'].get('top_k', 10)
             
         num_users = 0
 
         with torch.no_grad():
-            for batch_idx, batch in enumerate(tqdm(self.val_loader, desc="Validation")):
+            for batch_idx, batch in enumerate(tqdm(self._prefetch(self.val_loader), total=len(self.val_loader), desc="Validation")):
                 # Обработка батча
                 items_text_inputs, user_text_inputs, items_ids, user_ids = [
                     self.to_device(x) for x in batch
                 ]
                 
                 # Forward pass
-                items_embeddings, user_embeddings = self.model(
+                items_embeddings, user_embeddings = self.forward_model(
                     items_text_inputs, user_text_inputs, items_ids, user_ids
                 )
 
@@ -237,27 +193,33 @@ class Trainer:
                 # Расчет потерь
                 rec_loss = self.compute_recommendation_loss(user_embeddings, items_embeddings)
                 con_loss = self.compute_contrastive_loss(items_embeddings, user_embeddings)
-                total_loss += (con_loss + self.config['training']['lambda_rec'] * rec_loss).item()
+                total_loss += con_loss + self.config['training']['lambda_rec'] * rec_loss
                 total_recommendation_loss += rec_loss
                 total_contrastive_loss += con_loss
 
-                # Поиск рекомендаций и расчет метрик для всех пользователей в батче
+                # Поиск рекомендаций сразу для всего батча
+                rec_embeddings, indices = self._search(index_data, user_embeddings, top_k)
+                rec_categories = rec_category_ids[indices]
+                # Эмбеддинги из индекса нормализованы в indexer, а эмбеддинги батча - выше,
+                # поэтому косинусное сходство - это просто скалярное произведение.
+                # Считаем его для всего батча и переносим на CPU один раз
+                rec_similarities = torch.bmm(rec_embeddings, items_embeddings.unsqueeze(2)).squeeze(2).cpu()
+                recommended_ids = rec_video_ids[indices]
+
+                # Расчет метрик для всех пользователей в батче
                 for i in range(user_embeddings.size(0)):  # Убираем срез [:1]
                     user_metrics = self._process_user(
-                        user_embeddings[i], 
                         items_embeddings[i], 
+                        rec_embeddings[i], 
+                        rec_categories[i].tolist(), 
+                        recommended_ids[i].tolist(), 
                         items_ids[i], 
                         user_ids[i], 
-                        index, 
-                        video_ids, 
-                        df_videos_map,
-                        item_embeddings_array,
+                        category_by_item_id,
                         metrics_calculator,
-                        category_mapping,
                         top_k,
-                        demographic_data,
-                        demographic_features,
-                        demographic_centroids
+                        demographics_by_uid,
+                        rec_similarities[i]
                     )
                     self._update_metrics(metrics_accum, user_metrics)
                     num_users += 1
@@ -268,69 +230,224 @@ class Trainer:
         
         return self._compile_metrics(total_loss, total_contrastive_loss, total_recommendation_loss, metrics_accum, num_users)
 
-    def _process_user(self, user_emb, target_emb, items_ids, user_id, index, video_ids, df_videos_map, item_embeddings, metrics_calculator, category_mapping, top_k, demographic_data, demographic_features, demographic_centroids):
-        """Обработка одного пользователя для расчета метрик"""
-        # Поиск рекомендаций
-        user_emb_np = user_emb.cpu().numpy().astype('float32')
-        distances, indices = index.search(user_emb_np.reshape(1, -1), top_k)
+    def _load_val_data(self):
+        """Загрузка данных для валидации, не зависящих от весов модели (кэшируется)."""
+        if self._val_data is not None:
+            return self._val_data
+
+        # Загрузка необходимых данных (читаем только используемые колонки)
+        df_videos = pd.read_parquet("./data/video_info.parquet", columns=['clean_video_id', 'category'])
+
+        try:
+            category_mapping_df = pd.read_parquet('./data/mappings/category_mapping.parquet')
+            category_mapping = dict(zip(category_mapping_df['category'], category_mapping_df['category_id']))
+            print(f"Loaded category mapping with {len(category_mapping)} categories")
+        except Exception as e:
+            print(f"Warning: Could not load category mapping: {str(e)}")
+            category_mapping = {}
+
+        # ID категории (первой для видео) по числовому item_id: массив вместо словаря словарей,
+        # -1 для видео без метаданных, 'Unknown' для видео без категории
+        video_category_ids = (
+            df_videos
+            .groupby('clean_video_id')['category']
+            .first()
+            .fillna('Unknown')
+            .map(category_mapping)
+            .fillna(-1)
+        )
+        item_id_map = self.val_loader.dataset.item_id_map
+        category_by_item_id = np.full(max(item_id_map.values(), default=0) + 1, -1, dtype=np.int64)
+        category_by_item_id[list(item_id_map.values())] = (
+            video_category_ids.reindex(list(item_id_map.keys())).fillna(-1).to_numpy(np.int64)
+        )
+
+        # Загрузка демографических данных
+        try:
+            demographic_data = pd.read_parquet('./data/demographic_data.parquet')
+            demographic_features = ['age_group', 'sex', 'region']
+            # viewer_uid -> демографические признаки (первая запись пользователя) для O(1) поиска
+            demographics_by_uid = (
+                demographic_data
+                .drop_duplicates(subset='viewer_uid')
+                .set_index('viewer_uid')[demographic_features]
+                .to_dict(orient='index')
+            )
+            print(f"Loaded demographic data with features: {demographic_features}")
+        except Exception as e:
+            print(f"Warning: Could not load demographic data: {str(e)}")
+            demographic_data = None
+            demographic_features = None
+            demographics_by_uid = None
+
+        # Инициализация калькулятора метрик
+        sim_threshold_precision = self.config['metrics'].get('sim_threshold_precision', 0.07)
+        sim_threshold_ndcg = self.config['metrics'].get('sim_threshold_ndcg', 0.8)
+        calibration_samples = self.config['metrics'].get('calibration_samples', 1000)
+        metrics_calculator = MetricsCalculator(sim_threshold_precision=sim_threshold_precision,
+                                               sim_threshold_ndcg=sim_threshold_ndcg, calibration_samples=calibration_samples)
+
+        self._val_data = {
+            'category_by_item_id': category_by_item_id,
+            'demographic_data': demographic_data,
+            'demographic_features': demographic_features,
+            'demographics_by_uid': demographics_by_uid,
+            'metrics_calculator': metrics_calculator,
+        }
+        return self._val_data
+
+    def _load_index_data(self, val_data):
+        """Загрузка FAISS индекса и связанных данных (после каждого обновления индекса)."""
+        demographic_data = val_data['demographic_data']
+        demographic_features = val_data['demographic_features']
+
+        # Проверка и обновление индекса
+        index_path = self.config['inference']['index_path']
+        ids_path = self.config['inference']['ids_path']
+        embeddings_path = self.config['inference']['embeddings_path']
         
-        # List of recommended video IDs for metrics
-        rec_categories = []
-        recommended_ids = []
-        relevance_scores = {}  # Инициализируем словарь для relevance_scores
+        if not all(os.path.exists(p) for p in [index_path, ids_path, embeddings_path]):
+            print("\nIndex files not found, creating new index...")
+            try:
+                from indexer import main as create_index
+                create_index(config=self.config)
+            except Exception as e:
+                print(f"Error creating index: {str(e)}")
+                return None
+
+        # Загрузка индекса и данных
+        try:
+            video_ids = np.load(ids_path)
+            # Эмбеддинги отображаем в память: читаются только нужные строки
+            item_embeddings_array = np.load(embeddings_path, mmap_mode='r')
+            # На GPU поиск идет по единственной копии эмбеддингов (индекс IndexFlatIP строится
+            # по тем же нормализованным векторам), поэтому FAISS индекс нужен только для CPU
+            item_embeddings_gpu = None
+            if self.device.type == 'cuda':
+                item_embeddings_gpu = self._load_embeddings_to_device(item_embeddings_array)
+                index = None
+            else:
+                index = faiss.read_index(index_path)
+        except Exception as e:
+            print(f"Error loading index or embeddings: {str(e)}")
+            return None
         
-        if len(indices) > 0 and len(indices[0]) > 0:
-            # Получение рекомендаций
-            rec_embeddings = torch.tensor(item_embeddings[indices[0]], device=self.device)
-            # Метаданные рекомендаций
-            rec_categories = []
-            for idx in indices[0]:
-                # Get the video ID from the FAISS index
-                faiss_video_id = int(video_ids[idx][0])
-                recommended_ids.append(str(faiss_video_id))
-                
-                # Convert to original video ID for category lookup
-                orig_video_id = self.val_loader.dataset.reverse_item_id_map.get(faiss_video_id)
-                
-                # Добавляем relevance score (по умолчанию 1.0)
-                relevance_scores[str(faiss_video_id)] = 1.0
+        # Центроиды демографических групп нужны только для demographic_alignment_score,
+        # который пока не считается в compute_metrics, поэтому по умолчанию не строятся
+        demographic_centroids = None
+        if demographic_data is not None and self.config.get('metrics', {}).get('demographic_centroids', False):
+            try:
+                # История просмотров нужна только для центроидов, поэтому читается здесь
+                textual_history = pd.read_parquet('./data/textual_history.parquet', columns=['viewer_uid'])
+                demographic_centroids = self._build_demographic_centroids(
+                    textual_history, demographic_data, demographic_features, item_embeddings_array
+                )
+            except Exception as e:
+                print(f"Warning: Could not build demographic centroids: {str(e)}")
+                demographic_centroids = None
 
-                if orig_video_id in df_videos_map:
-                    categories = df_videos_map[orig_video_id].get('category', [])
-                    if isinstance(categories, list) and len(categories) > 0:
-                        category_name = categories[0]  # берем первую
-                    else:
-                        category_name = 'Unknown'
-                    category_id = category_mapping.get(category_name, -1)
-                    rec_categories.append(category_id)
-                else:
-                    rec_categories.append(-1)
-        else:
-            # Если нет рекомендаций, создаем пустые данные
-            rec_embeddings = torch.zeros((0, user_emb.size(0)), device=self.device)
-            recommended_ids = []
-            rec_categories = []
+        # ID и категории для каждой позиции индекса, чтобы рекомендации батча
+        # переводились в метаданные одной индексацией массивов
+        faiss_video_ids = video_ids[:, 0].astype(np.int64)
+        rec_video_ids = np.array([str(v) for v in faiss_video_ids], dtype=object)
+        rec_category_ids = self._lookup_categories(val_data['category_by_item_id'], faiss_video_ids)
+
+        return {
+            'index': index,
+            'video_ids': video_ids,
+            'item_embeddings_array': item_embeddings_array,
+            'item_embeddings_gpu': item_embeddings_gpu,
+            'rec_video_ids': rec_video_ids,
+            'rec_category_ids': rec_category_ids,
+            'demographic_centroids': demographic_centroids,
+        }
+
+    def _build_demographic_centroids(self, textual_history, demographic_data, demographic_features, item_embeddings_array):
+        """Центроиды эмбеддингов для каждой демографической группы по каждому признаку."""
+        # viewer_uid -> индекс первой строки пользователя в истории просмотров
+        first_rows = ~textual_history['viewer_uid'].duplicated()
+        uid_index = pd.Index(textual_history['viewer_uid'][first_rows])
+        history_idx = textual_history.index[first_rows].to_numpy()
+
+        # Индексы эмбеддингов для всех пользователей из демографии (один проход вместо поиска по каждому)
+        positions = uid_index.get_indexer(demographic_data['viewer_uid'])
+        user_idx = np.where(positions >= 0, history_idx[positions], -1)
+        valid = (positions >= 0) & (user_idx < len(item_embeddings_array))
+        user_idx = user_idx[valid]
+
+        demographic_centroids = {}
+        for feature in demographic_features:
+            demographic_centroids[feature] = {}
+            codes, groups = pd.factorize(demographic_data[feature].to_numpy()[valid])
+            has_group = codes >= 0
+            if not has_group.any():
+                continue
+
+            # Сортируем по группе и суммируем эмбеддинги отрезками: одна выборка строк
+            # в исходном dtype, накопление сумм в float64
+            order = np.flatnonzero(has_group)[np.argsort(codes[has_group], kind='stable')]
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+            sums = np.add.reduceat(item_embeddings_array[user_idx[order]], starts, axis=0, dtype=np.float64)
+            counts = np.diff(np.r_[starts, len(sorted_codes)])
+            centroids = (sums / counts[:, None]).astype(item_embeddings_array.dtype)
+
+            for code, centroid in zip(sorted_codes[starts], centroids):
+                demographic_centroids[feature][groups[code]] = torch.tensor(centroid, device=self.device)
+
+        return demographic_centroids
+
+    def _load_embeddings_to_device(self, item_embeddings_array):
+        """Копирует эмбеддинги айтемов из memmap на устройство частями, не читая файл целиком в RAM."""
+        item_embeddings = torch.empty(item_embeddings_array.shape, dtype=torch.float32, device=self.device)
+        for start in range(0, len(item_embeddings_array), ITEM_CHUNK_SIZE):
+            chunk = np.asarray(item_embeddings_array[start:start + ITEM_CHUNK_SIZE], dtype=np.float32)
+            item_embeddings[start:start + len(chunk)].copy_(torch.from_numpy(chunk))
+        return item_embeddings
+
+    def _search(self, index_data, user_embeddings, top_k):
+        """Поиск top_k рекомендаций для батча пользователей: (эмбеддинги рекомендаций, индексы в numpy)."""
+        item_embeddings_gpu = index_data['item_embeddings_gpu']
+        if item_embeddings_gpu is not None:
+            # Точный поиск по скалярному произведению (как IndexFlatIP) частями по айтемам,
+            # чтобы матрица сходств батча не занимала batch_size x n_items
+            queries = user_embeddings.float()
+            best_scores, best_indices = None, None
+            for start in range(0, item_embeddings_gpu.size(0), ITEM_CHUNK_SIZE):
+                scores = queries @ item_embeddings_gpu[start:start + ITEM_CHUNK_SIZE].T
+                scores, indices = torch.topk(scores, min(top_k, scores.size(1)), dim=1)
+                indices += start
+                if best_scores is not None:
+                    scores = torch.cat([best_scores, scores], dim=1)
+                    indices = torch.cat([best_indices, indices], dim=1)
+                    scores, order = torch.topk(scores, min(top_k, scores.size(1)), dim=1)
+                    indices = indices.gather(1, order)
+                best_scores, best_indices = scores, indices
+            rec_embeddings = item_embeddings_gpu[best_indices]
+            return rec_embeddings, best_indices.cpu().numpy()
+
+        index = index_data['index']
+        user_emb_np = user_embeddings.cpu().numpy().astype('float32', copy=False)
+        distances, indices = index.search(user_emb_np, top_k)
+        rec_embeddings = torch.from_numpy(np.asarray(index_data['item_embeddings_array'][indices])).to(self.device)
+        return rec_embeddings, indices
+
+    def _lookup_categories(self, category_by_item_id, item_ids):
+        """ID категорий для массива числовых item_id (-1 для неизвестных)."""
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        valid = (item_ids >= 0) & (item_ids < len(category_by_item_id))
+        return np.where(valid, category_by_item_id[np.where(valid, item_ids, 0)], -1)
+
+    def _process_user(self, target_emb, rec_embeddings, rec_categories, recommended_ids, items_ids, user_id, category_by_item_id, metrics_calculator, top_k, demographics_by_uid, rec_similarities=None):
+        """Обработка одного пользователя для расчета метрик (рекомендации уже найдены для всего батча)"""
+        # Добавляем relevance score (по умолчанию 1.0)
+        relevance_scores = {video_id: 1.0 for video_id in recommended_ids}
         
         # Target category info
         target_id = items_ids[0].item() if len(items_ids) > 0 and items_ids[0].item() > 0 else None
-        # print(f"target_id = {target_id}")
         target_category = -1
-        # print('=============')
         if target_id is not None:
-            orig_target_video_id = self.val_loader.dataset.reverse_item_id_map.get(target_id)
-            # print(f"orig_target_video_id = {orig_target_video_id}")
-#            print(f"self.val_loader.dataset.reverse_item_id_map = {self.val_loader.dataset.reverse_item_id_map}")
-            if orig_target_video_id in df_videos_map:
-                # print(f"orig_target_video_id = {orig_target_video_id}")
-                # category_name = df_videos_map[orig_target_video_id].get('category', 'Unknown')
-                # target_category = category_mapping.get(category_name, -1)
-                categories = df_videos_map[orig_video_id].get('category', [])
-                # print(f"categories = {categories}")
-                if isinstance(categories, list) and len(categories) > 0:
-                    category_name = categories[0]  # берем первую
-                else:
-                    category_name = 'Unknown'
-                target_category = category_mapping.get(category_name, -1)
+            target_category = int(self._lookup_categories(category_by_item_id, [target_id])[0])
 
         # User demographic data
         # user_demographics = {}
@@ -344,15 +461,9 @@ class Trainer:
         #                            if feature in user_row}
         # Демографические данные
         user_demographics = {}
-        if demographic_data is not None:
+        if demographics_by_uid is not None:
             orig_user_id = self.val_loader.dataset.reverse_user_id_map.get(user_id.item())
-
-            # Фильтруем нужного пользователя по его ID
-            user_row = demographic_data[demographic_data['viewer_uid'] == orig_user_id]
-
-            if not user_row.empty:  # Проверяем, есть ли данные
-                user_row = user_row.iloc[0]
-                user_demographics = {feature: user_row[feature] for feature in demographic_features}  # Заполняем user_demo сразу
+            user_demographics = demographics_by_uid.get(orig_user_id, {})
 
         # Создаем множество релевантных ID (для классических метрик)
         # В данном случае считаем релевантными те видео, которые пользователь уже смотрел
@@ -371,7 +482,8 @@ class Trainer:
             recommended_ids,
             relevant_ids,
             relevance_scores,
-            top_k
+            top_k,
+            similarities=rec_similarities
         )
 
 
@@ -387,9 +499,9 @@ class Trainer:
     def _compile_metrics(self, total_loss, contrastive_loss, recommendation_loss, metrics_accum, num_users):
         """Компиляция финальных метрик."""
         metrics_dict = {
-            'val_loss': total_loss / len(self.val_loader),
-            'val_contrastive_loss': contrastive_loss / len(self.val_loader),
-            'val_recommendation_loss': recommendation_loss / len(self.val_loader)
+            'val_loss': total_loss.item() / len(self.val_loader),
+            'val_contrastive_loss': contrastive_loss.item() / len(self.val_loader),
+            'val_recommendation_loss': recommendation_loss.item() / len(self.val_loader)
         }
         
         if num_users > 0:
@@ -479,41 +591,43 @@ class Trainer:
             self.to_device(x) for x in batch
         ]
 
-        # Forward pass
-        items_embeddings, user_embeddings = self.model(
-            items_text_inputs, user_text_inputs, items_ids, user_ids
-        )
+        with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype, enabled=self.use_amp):
+            # Forward pass
+            items_embeddings, user_embeddings = self.forward_model(
+                items_text_inputs, user_text_inputs, items_ids, user_ids
+            )
 
-        # Нормализация эмбеддингов
-        items_embeddings = F.normalize(items_embeddings, p=2, dim=1)
-        user_embeddings = F.normalize(user_embeddings, p=2, dim=1)
+            # Нормализация эмбеддингов
+            items_embeddings = F.normalize(items_embeddings, p=2, dim=1)
+            user_embeddings = F.normalize(user_embeddings, p=2, dim=1)
 
-        # Потери
-        recommendation_loss = self.compute_recommendation_loss(
-            user_embeddings, items_embeddings
-        )
-        contrastive_loss = self.compute_contrastive_loss(
-            items_embeddings, user_embeddings
-        )
+            # Потери
+            recommendation_loss = self.compute_recommendation_loss(
+                user_embeddings, items_embeddings
+            )
+            contrastive_loss = self.compute_contrastive_loss(
+                items_embeddings, user_embeddings
+            )
 
-        # Общая потеря
-        loss = contrastive_loss + self.config['training']['lambda_rec'] * recommendation_loss
+            # Общая потеря
+            loss = contrastive_loss + self.config['training']['lambda_rec'] * recommendation_loss
 
-        # Backpropagation
+        # Backpropagation (scaler активен только для fp16)
         self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
+        self.scaler.scale(loss).backward()
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
 
-        return loss.item(), contrastive_loss.item(), recommendation_loss.item()
+        return loss.detach(), contrastive_loss.detach(), recommendation_loss.detach()
     
     def compute_recommendation_loss(self, user_embeddings, items_embeddings):
-        """Вычисление потери рекомендаций."""
+        """Вычисление потери рекомендаций (эмбеддинги уже L2-нормализованы)."""
         logits = torch.matmul(user_embeddings, items_embeddings.T)
-        labels = torch.arange(len(user_embeddings)).to(self.device)
+        labels = torch.arange(len(user_embeddings), device=self.device)
         return self.recommendation_loss_fn(logits, labels)
 
     def compute_contrastive_loss(self, items_embeddings, user_embeddings):
-        """Вычисление контрастивной потери."""
+        """Вычисление контрастивной потери (эмбеддинги уже L2-нормализованы)."""
 
         batch_size = items_embeddings.size(0)
         positive_labels = torch.ones(batch_size, device=self.device)
@@ -533,7 +647,31 @@ class Trainer:
         return contrastive_goods_loss + contrastive_users_loss
 
     def to_device(self, x):
-        """Перемещение данных на устройство."""
+        """Перемещение данных на устройство (асинхронно для pinned memory)."""
         if isinstance(x, dict):
-            return {k: v.to(self.device) for k, v in x.items()}
-        return x.to(self.device)
+            return {k: v.to(self.device, non_blocking=True) for k, v in x.items()}
+        return x.to(self.device, non_blocking=True)
+
+    def _prefetch(self, loader):
+        """Итерация по loader, пока батч обрабатывается, следующий копируется на GPU в отдельном CUDA stream."""
+        if self.device.type != 'cuda':
+            for batch in loader:
+                yield [self.to_device(x) for x in batch]
+            return
+
+        copy_stream = torch.cuda.Stream(device=self.device)
+        main_stream = torch.cuda.current_stream(self.device)
+        current = None
+        for batch in loader:
+            with torch.cuda.stream(copy_stream):
+                next_batch = [self.to_device(x) for x in batch]
+            if current is not None:
+                yield current
+            # Основной поток ждет окончания копирования перед использованием батча
+            main_stream.wait_stream(copy_stream)
+            for x in next_batch:
+                for tensor in (x.values() if isinstance(x, dict) else [x]):
+                    tensor.record_stream(main_stream)
+            current = next_batch
+        if current is not None:
+            yield current
@@ -1,9 +1,34 @@
+import torch
 import torch.nn as nn
 
 
+class UnitCosineEmbeddingLoss(nn.CosineEmbeddingLoss):
+    """
+    CosineEmbeddingLoss для уже L2-нормализованных эмбеддингов:
+    косинус равен скалярному произведению, нормы внутри лосса не пересчитываются.
+    Вызывающий код обязан нормализовать input1 и input2 (F.normalize(..., dim=1)),
+    иначе значение лосса будет неверным без какой-либо ошибки
+    """
+    def forward(self, input1, input2, target):
+        cos = (input1 * input2).sum(dim=1)
+        loss = torch.where(target > 0, 1 - cos, (cos - self.margin).clamp(min=0))
+        if self.reduction == 'mean':
+            return loss.mean()
+        if self.reduction == 'sum':
+            return loss.sum()
+        return loss
+
+
 def get_losses(name_contrastive_loss):
+    """
+    'cos_emb' - стандартный nn.CosineEmbeddingLoss,
+    'cos_emb_unit' - тот же лосс для эмбеддингов, которые вызывающий код уже L2-нормализовал
+    """
     if name_contrastive_loss == 'cos_emb':
         contrastive_loss_fn = nn.CosineEmbeddingLoss()
+    elif name_contrastive_loss == 'cos_emb_unit':
+        # Модель возвращает ненормализованные эмбеддинги: нормализует вызывающий код (Trainer)
+        contrastive_loss_fn = UnitCosineEmbeddingLoss()
     else:
         pass # for future experiments
 
@@ -0,0 +1,30 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ITEM_ID_MAP_PATH = './data/mappings/item_id_map.parquet'
+LEGACY_ITEM_ID_MAP_PATH = './data/mappings/item_id_map.json'
+
+
+def save_item_id_map(item_id_map, path=ITEM_ID_MAP_PATH):
+    """
+    Сохраняет маппинг {исходный ID: числовой ID} как parquet-таблицу (original_id, item_id)
+    """
+    table = pa.table({
+        'original_id': pa.array(list(item_id_map.keys()), type=pa.string()),
+        'item_id': pa.array(list(item_id_map.values()), type=pa.int64()),
+    })
+    pq.write_table(table, path)
+
+
+def load_item_id_map(path=ITEM_ID_MAP_PATH):
+    """
+    Загружает маппинг {исходный ID: числовой ID}; если parquet нет, читает старый JSON
+    """
+    if not os.path.exists(path) and os.path.exists(LEGACY_ITEM_ID_MAP_PATH):
+        with open(LEGACY_ITEM_ID_MAP_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    table = pq.read_table(path, columns=['original_id', 'item_id'])
+    return dict(zip(table.column('original_id').to_pylist(), table.column('item_id').to_pylist()))
@@ -85,12 +85,14 @@ class MetricsCalculator:
     def semantic_precision_at_k(self, 
                             item_embedding: torch.Tensor,
                             recommended_embeddings: torch.Tensor,
-                            k: int) -> float:
+                            k: int,
+                            similarities: torch.Tensor = None) -> float:
         """
         Вычисляет Semantic Precision@K.
         
         Сравнивает каждый рекомендованный эмбеддинг с эмбеддингом просмотренного товара
         и считает долю рекомендаций, которые семантически близки к нему.
+        Если similarities переданы (уже посчитанные косинусные сходства), они не пересчитываются.
         """
         if recommended_embeddings.shape[0] == 0:
             return 0.0
@@ -101,11 +103,12 @@ class MetricsCalculator:
             print(f"Используем порог по умолчанию для precision: {self.sim_threshold_precision}")
         
         # Вычисление косинусного сходства
-        similarities = F.cosine_similarity(
-            item_embedding.unsqueeze(0),
-            recommended_embeddings,
-            dim=1
-        )
+        if similarities is None:
+            similarities = F.cosine_similarity(
+                item_embedding.unsqueeze(0),
+                recommended_embeddings,
+                dim=1
+            )
 
         # Считаем, сколько попало выше порога
         successes = (similarities >= self.sim_threshold_precision).sum().item()
@@ -130,9 +133,11 @@ class MetricsCalculator:
                        item_embedding: torch.Tensor,
                        recommended_embeddings: torch.Tensor,
                        target_category: str,
-                       recommended_categories: List[str]) -> float:
+                       recommended_categories: List[str],
+                       similarities: torch.Tensor = None) -> float:
         """
         Вычисляет Contextual NDCG, учитывая семантическую близость и категории.
+        Если similarities переданы (уже посчитанные косинусные сходства), они не пересчитываются.
         """
         if recommended_embeddings.shape[0] == 0:
             return 0.0
@@ -143,11 +148,12 @@ class MetricsCalculator:
             print(f"Используем порог по умолчанию для NDCG: {self.sim_threshold_ndcg}")
         
         # Вычисление косинусного сходства
-        similarities = F.cosine_similarity(
-            item_embedding.unsqueeze(0),
-            recommended_embeddings,
-            dim=1
-        )
+        if similarities is None:
+            similarities = F.cosine_similarity(
+                item_embedding.unsqueeze(0),
+                recommended_embeddings,
+                dim=1
+            )
         
         # Вычисляем релевантность для каждой рекомендации
         relevance = []
@@ -359,7 +365,8 @@ class MetricsCalculator:
                        recommended_ids: List[str] = None,
                        relevant_ids: Set[str] = None,
                        relevance_scores: Dict[str, float] = None,
-                       k: int = 10) -> Dict[str, float]:  #user_demographics: Dict[str, str] = None,
+                       k: int = 10,
+                       similarities: torch.Tensor = None) -> Dict[str, float]:  #user_demographics: Dict[str, str] = None,
                        #demographic_centroids: Dict[str, Dict[str, torch.Tensor]] = None
         """
         Вычисляет все метрики для одного пользователя.
@@ -373,6 +380,7 @@ class MetricsCalculator:
             relevant_ids: множество ID релевантных элементов
             relevance_scores: словарь с оценками релевантности для каждого ID
             k: количество рекомендаций для оценки
+            similarities: косинусные сходства item_embedding с рекомендациями (опционально)
             
         Returns:
             Dict с вычисленными метриками
@@ -384,7 +392,8 @@ class MetricsCalculator:
             metrics["semantic_precision@k"] = self.semantic_precision_at_k(
                 item_embedding,
                 recommended_embeddings,
-                k
+                k,
+                similarities
             )
             
             metrics["cross_category_relevance"] = self.cross_category_relevance(
@@ -397,7 +406,8 @@ class MetricsCalculator:
                 item_embedding,
                 recommended_embeddings,
                 target_category,
-                recommended_categories
+                recommended_categories,
+                similarities
             )
         else:
             metrics["semantic_precision@k"] = 0.0